@@ -5,6 +5,11 @@
 - `info_logger` записывает сообщения уровня INFO в stdout
 - `error_logger` записывает сообщения уровня ERROR в stderr
 
+Логгеры не пишут в потоки вывода напрямую: записи помещаются в очередь,
+а форматирование и запись выполняет фоновый поток `QueueListener`.
+На время fork (например, при запуске воркеров gunicorn с --preload) фоновый
+поток останавливается и после fork запускается заново в обоих процессах.
+
 Attributes
 ----------
 info_logger : logging.Logger
@@ -17,17 +22,36 @@ error_logger : logging.Logger
     - Вывод: stderr
 """
 
+import atexit
 import logging
+import os
+import queue
 import sys
+from logging.handlers import QueueHandler, QueueListener
 
-info_logger = logging.getLogger("info")
-info_logger.setLevel(logging.INFO)
 info_handler = logging.StreamHandler(sys.stdout)
 info_handler.setFormatter(logging.Formatter("%(asctime)s - INFO: %(message)s"))
-info_logger.addHandler(info_handler)
+info_handler.addFilter(logging.Filter("info"))
 
-error_logger = logging.getLogger("error")
-error_logger.setLevel(logging.ERROR)
 error_handler = logging.StreamHandler(sys.stderr)
 error_handler.setFormatter(logging.Formatter("%(asctime)s - ERROR: %(message)s"))
-error_logger.addHandler(error_handler)
+error_handler.addFilter(logging.Filter("error"))
+
+log_queue = queue.SimpleQueue()
+queue_handler = QueueHandler(log_queue)
+listener = QueueListener(log_queue, info_handler, error_handler)
+listener.start()
+os.register_at_fork(
+    before=listener.stop,
+    after_in_parent=listener.start,
+    after_in_child=listener.start,
+)
+atexit.register(listener.stop)
+
+info_logger = logging.getLogger("info")
+info_logger.setLevel(logging.INFO)
+info_logger.addHandler(queue_handler)
+
+error_logger = logging.getLogger("error")
+error_logger.setLevel(logging.ERROR)
+error_logger.addHandler(queue_handler)
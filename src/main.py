@@ -1,29 +1,70 @@
-from functools import lru_cache
-import json
+from contextlib import asynccontextmanager
+import os
+from pathlib import Path
+import threading
 
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.openapi.docs import (
     get_redoc_html,
     get_swagger_ui_html,
     get_swagger_ui_oauth2_redirect_html,
 )
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, ORJSONResponse
 from fastapi.staticfiles import StaticFiles
 import joblib
-import pandas as pd
+
+# Модули, необходимые для десериализации модели, импортируются заранее, чтобы
+# при запуске gunicorn с --preload их страницы разделялись воркерами через
+# copy-on-write. Импорт не запускает потоки OpenMP, а сама модель в мастере
+# не загружается (см. `lifespan`).
+import lightgbm.sklearn  # noqa: F401
+import numpy as np
+import orjson
 
 from loggers import error_logger, info_logger
-from processing import change_types
+from processing import CATEGORY_CODES
 from pydantic_models import Diamond
 
 MODEL_REGISTRY_PATH = "model_registry"
 MODEL_SETTINGS_PATH = f"{MODEL_REGISTRY_PATH}/modelsettings.json"
 
+CUT_CODES = CATEGORY_CODES["Огранка"]
+COLOR_CODES = CATEGORY_CODES["Цвет"]
+CLARITY_CODES = CATEGORY_CODES["Чистота"]
+
+# Кэш модели: (st_mtime_ns файла настроек, бустер модели).
+model_cache = None
+# Блокировка, под которой модель загружается повторно только одним потоком.
+model_lock = threading.Lock()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Загружает модель при запуске каждого воркера.
+
+    В мастер-процессе gunicorn модель не загружается и LightGBM не вызывается:
+    OpenMP (libgomp), инициализированный в мастере, зависает в дочернем
+    процессе после fork. Поэтому бустер загружается в каждом воркере и его
+    память не разделяется между ними. Загрузка выполняется в пуле потоков,
+    чтобы не блокировать цикл событий. Если модель загрузить не удалось,
+    ошибка уже записана в лог, и загрузка повторится при первом запросе.
+    """
+    try:
+        await run_in_threadpool(load_model)
+    except HTTPException:
+        pass
+    yield
+
+
 app = FastAPI(
     title="ML Web Service fo diamond price prediction",
     version="1.0.0",
     docs_url=None,
     redoc_url=None,
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan,
 )
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
@@ -83,42 +124,94 @@ async def custom_redoc() -> HTMLResponse:
     )
 
 
-@lru_cache(maxsize=1)
-def load_model():
+def get_settings_mtime() -> int | None:
+    """
+    Возвращает время изменения файла настроек модели.
+
+    Returns
+    -------
+    `int | None`
+        Значение st_mtime_ns файла настроек или None, если файла нет.
+    """
+    try:
+        return os.stat(MODEL_SETTINGS_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+def load_model(force: bool = False):
     """
     Загружает модель машинного обучения из реестра.
 
+    Из загруженной модели извлекается бустер LightGBM, чтобы прогнозы
+    выполнялись без проверок и преобразований обертки scikit-learn.
+
+    Модель кэшируется вместе со временем изменения файла настроек. При каждом
+    вызове время изменения сверяется с кэшированным, и модель загружается
+    повторно только если файл настроек был перезаписан. Повторная загрузка
+    выполняется под блокировкой: потоки, дождавшиеся её, заново сверяют время
+    изменения и получают уже загруженную модель.
+
+    Если загрузить модель не удалось, а в кэше есть ранее загруженная модель,
+    ошибка записывается в лог один раз для данного времени изменения файла
+    настроек, и используется модель из кэша.
+
+    Parameters
+    ----------
+    force : `bool`, default=False
+        Загрузить модель из реестра, даже если файл настроек не изменился.
+        При ошибке загрузки модель из кэша не используется.
+
     Returns
     -------
-    model : `lightgbm.sklearn.LGBMRegressor`
-        Объект модели, совместимый с интерфейсом scikit-learn, загруженный из файла.
+    booster : `lightgbm.Booster`
+        Бустер модели `lightgbm.sklearn.LGBMRegressor`, загруженной из файла.
 
     Raises
     ------
     HTTPException
+        Если загрузить модель не удалось и модель из кэша не используется:
         - 404 Not Found: Если отсутствует файл настроек модели или сама модель.
-        - 422 Unprocessable Entity: Если в JSON-файле настроек отсутствуют обязательные ключи.
+        - 422 Unprocessable Entity: Если файл настроек не удалось разобрать
+          или в нём отсутствуют обязательные ключи.
     """
-    try:
-        with open(MODEL_SETTINGS_PATH, encoding="utf-8") as file:
-            model_settings = json.load(file)
-        model_path = f"{MODEL_REGISTRY_PATH}/{model_settings['file_path']}"
-        model = joblib.load(model_path)
-        return model
-    except FileNotFoundError as e:
-        message_error = f"Отсутствует файл с настройками модели или сама модель. {e}"
+    global model_cache
+    settings_mtime = get_settings_mtime()
+    if not force and model_cache is not None and model_cache[0] == settings_mtime:
+        return model_cache[1]
+    with model_lock:
+        settings_mtime = get_settings_mtime()
+        if not force and model_cache is not None and model_cache[0] == settings_mtime:
+            return model_cache[1]
+        try:
+            model_settings = orjson.loads(Path(MODEL_SETTINGS_PATH).read_bytes())
+            model_path = f"{MODEL_REGISTRY_PATH}/{model_settings['file_path']}"
+            # mmap_mode не используется: бустер LightGBM сериализуется текстовой
+            # моделью, а не массивами numpy, поэтому отображать в память нечего.
+            model = joblib.load(model_path)
+            model_cache = (settings_mtime, model.booster_)
+            return model.booster_
+        except FileNotFoundError as e:
+            status_code = 404
+            message_error = (
+                f"Отсутствует файл с настройками модели или сама модель. {e}"
+            )
+        except KeyError as e:
+            status_code = 422
+            message_error = (
+                f"В файле настроек отсутствует ключ: {e}. Не удалось загрузить модель."
+            )
+        except orjson.JSONDecodeError as e:
+            status_code = 422
+            message_error = f"Не удалось разобрать файл настроек модели. {e}"
         error_logger.error(message_error)
+        if not force and model_cache is not None:
+            # Время изменения запоминается, чтобы до следующего изменения файла
+            # настроек не повторять загрузку и запись ошибки в лог.
+            model_cache = (settings_mtime, model_cache[1])
+            return model_cache[1]
         raise HTTPException(
-            status_code=404,
-            detail=message_error,
-        )
-    except KeyError as e:
-        message_error = (
-            f"В файле настроек отсутствует ключ: {e}. Не удалось загрузить модель."
-        )
-        error_logger.error(message_error)
-        raise HTTPException(
-            status_code=422,
+            status_code=status_code,
             detail=message_error,
         )
 
@@ -128,24 +221,51 @@ def update_model() -> dict[str, str]:
     """
     Обработчик POST-запроса для принудительного обновления кэшированной модели.
 
-    Очищает LRU-кэш функции загрузки модели, повторно загружает модель из реестра.
+    Повторно загружает модель из реестра в обход кэша функции загрузки модели.
+    Изменения файла настроек подхватываются и без этого запроса.
 
     Returns
     -------
     `dict[str, str]`
         Сообщение об успешном обновлении модели.
     """
-    load_model.cache_clear()
-    model = load_model()
+    load_model(force=True)
     info_logger.info("Модель успешно обновлена.")
     return {"message": "Модель успешно обновлена."}
 
 
+def predict_price(features: np.ndarray) -> float:
+    """
+    Получает модель из кэша и вычисляет прогноз цены бриллианта.
+
+    Получение модели (в том числе её повторная загрузка при изменении файла
+    настроек) и прогноз бустером объединены в одну синхронную функцию, чтобы
+    на каждый запрос приходился один переход в пул потоков.
+
+    Parameters
+    ----------
+    features : `np.ndarray`
+        Матрица признаков бриллианта размера (1, 4) типа float32.
+
+    Returns
+    -------
+    `float`
+        Прогноз по стоимости бриллианта, округлённый до трёх знаков.
+    """
+    booster = load_model()
+    info_logger.info("Модель успешно загружена.")
+    prediction = booster.predict(features, predict_disable_shape_check=True)
+    return prediction.round(3)[0]
+
+
 @app.post("/diamond_price")
-def get_diamond_price_prediction(diamond: Diamond) -> dict[str, float]:
+async def get_diamond_price_prediction(diamond: Diamond) -> dict[str, float]:
     """
     Обработчик POST-запроса для прогнозирования цены бриллианта.
 
+    Признаки подготавливаются в цикле событий, а получение модели и вычисление
+    прогноза выполняются в пуле потоков за один переход.
+
     Parameters
     ----------
     diamond : `Diamond`
@@ -156,11 +276,18 @@ def get_diamond_price_prediction(diamond: Diamond) -> dict[str, float]:
     `dict[str, float]`
         Прогноз по стоимости бриллианта.
     """
-    df = pd.DataFrame([diamond.model_dump()])
-    df = change_types(df)
-    model = load_model()
-    info_logger.info("Модель успешно загружена.")
-    prediction = model.predict(df).round(3)[0]
+    features = np.array(
+        [
+            [
+                diamond.carat,
+                CUT_CODES[diamond.cut],
+                COLOR_CODES[diamond.color],
+                CLARITY_CODES[diamond.clarity],
+            ]
+        ],
+        dtype=np.float32,
+    )
+    prediction = await run_in_threadpool(predict_price, features)
     info_logger.info("Прогноз по бриллианту успешно получен.")
     return {"price": prediction}
 
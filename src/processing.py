@@ -4,12 +4,31 @@
 Основные возможности:
 - Переименование колонок в соответствии с русскоязычными названиями;
 - Очистка данных от пропущенных значений и дубликатов;
+- Кодирование категориальных признаков по заранее известному набору категорий;
 - Оптимизация типов данных для экономии памяти;
 - Разделение данных на признаки и целевую переменную.
 """
 
+from collections.abc import Sequence
+
+import numpy as np
 import pandas as pd
 
+CUT_DTYPE = pd.CategoricalDtype(["Fair", "Good", "Ideal", "Premium", "Very Good"])
+COLOR_DTYPE = pd.CategoricalDtype(["D", "E", "F", "G", "H", "I", "J"])
+CLARITY_DTYPE = pd.CategoricalDtype(
+    ["I1", "IF", "SI1", "SI2", "VS1", "VS2", "VVS1", "VVS2"]
+)
+CATEGORICAL_DTYPES = {
+    "Огранка": CUT_DTYPE,
+    "Цвет": COLOR_DTYPE,
+    "Чистота": CLARITY_DTYPE,
+}
+CATEGORY_CODES = {
+    column: {category: code for code, category in enumerate(dtype.categories)}
+    for column, dtype in CATEGORICAL_DTYPES.items()
+}
+
 
 def rename_columns(df: pd.DataFrame) -> pd.DataFrame:
     """
@@ -49,6 +68,9 @@ def clean_data(df: pd.DataFrame) -> pd.DataFrame:
     1. Удаляет все строки, содержащие хотя бы одно пропущенное значение (NaN).
     2. Удаляет полностью дублирующиеся строки, сохраняя только первое вхождение.
 
+    Обе маски строк вычисляются по исходному датафрейму и применяются
+    за одну выборку, поэтому промежуточный датафрейм не создается.
+
     Parameters
     ----------
     df : `pd.DataFrame`
@@ -59,11 +81,39 @@ def clean_data(df: pd.DataFrame) -> pd.DataFrame:
     `pd.DataFrame`
         Очищенный датафрейм без пропусков и дубликатов.
     """
-    df = df.dropna()
-    df = df.drop_duplicates()
+    mask = ~df.isna().any(axis=1) & ~df.duplicated(keep="first")
+    df = df.loc[mask]
     return df
 
 
+def encode_categories(
+    values: Sequence[str | None], dtype: pd.CategoricalDtype
+) -> pd.Categorical:
+    """
+    Кодирует значения категориального признака по заранее известному набору
+    категорий.
+
+    Коды категорий находятся поиском значений в индексе известных категорий,
+    поэтому pandas не вычисляет уникальные значения данных. Значения,
+    отсутствующие в наборе категорий (в том числе None), становятся
+    пропусками (NaN).
+
+    Parameters
+    ----------
+    values : `Sequence[str | None]`
+        Значения категориального признака.
+    dtype : `pd.CategoricalDtype`
+        Тип данных с известным набором категорий.
+
+    Returns
+    -------
+    `pd.Categorical`
+        Категориальный массив с категориями из `dtype`.
+    """
+    codes = dtype.categories.get_indexer(np.asarray(values, dtype=object))
+    return pd.Categorical.from_codes(codes, dtype=dtype)
+
+
 def change_types(df: pd.DataFrame) -> pd.DataFrame:
     """
     Оптимизирует типы данных для снижения потребления памяти.
@@ -71,6 +121,9 @@ def change_types(df: pd.DataFrame) -> pd.DataFrame:
     Выполняет следующие преобразования:
     - Все количественные переменные преобразуются в float32.
     - Все категориальные переменные преобразуются в category.
+      Для колонок 'Огранка', 'Цвет' и 'Чистота' используется заранее известный
+      набор категорий из `CATEGORICAL_DTYPES`, поэтому коды категорий
+      совпадают при обучении и при получении прогнозов.
 
     Parameters
     ----------
@@ -82,11 +135,15 @@ def change_types(df: pd.DataFrame) -> pd.DataFrame:
     `pd.DataFrame`
         Новый датафрейм с оптимизированными типами данных.
     """
-    df_new = df.copy()
-    for column in df_new.select_dtypes(include=["float64", "int64"]):
-        df_new[column] = df_new[column].astype("float32")
-    for column in df_new.select_dtypes(include="object"):
-        df_new[column] = df_new[column].astype("category")
+    dtypes = {
+        column: "float32"
+        for column in df.select_dtypes(include=["float64", "int64"]).columns
+    }
+    dtypes |= {
+        column: CATEGORICAL_DTYPES.get(column, "category")
+        for column in df.select_dtypes(include="object").columns
+    }
+    df_new = df.astype(dtypes)
     return df_new
 
 
@@ -1,9 +1,11 @@
 from typing import Literal
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
 
 class Diamond(BaseModel):
+    model_config = ConfigDict(frozen=True, extra="forbid")
+
     carat: float = Field(ge=0.2, le=5.01)
     cut: Literal["Ideal", "Premium", "Very Good", "Good", "Fair"]
     color: Literal["G", "E", "F", "H", "D", "I", "J"]
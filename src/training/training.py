@@ -9,26 +9,45 @@
 5. Обновление реестра моделей при улучшении метрики качества.
 """
 
-import json
+import os
 import sqlite3
 import sys
 from datetime import date
+from pathlib import Path
 
 import joblib
+import numpy as np
+import orjson
 import pandas as pd
-from sklearn.model_selection import cross_val_score
+from sklearn.base import clone
+from sklearn.model_selection import KFold
 
 from loggers import error_logger, info_logger
-from processing import change_types, clean_data, rename_columns, split_data
+from processing import (
+    CLARITY_DTYPE,
+    COLOR_DTYPE,
+    CUT_DTYPE,
+    change_types,
+    clean_data,
+    encode_categories,
+    rename_columns,
+    split_data,
+)
 
 MODEL_REGISTRY_PATH = "model_registry"
 MODEL_SETTINGS_PATH = f"{MODEL_REGISTRY_PATH}/modelsettings.json"
+CV_N_SPLITS = 5
 
 
 def load_data() -> pd.DataFrame:
     """
     Загружает данные о бриллиантах из SQLite.
 
+    Строки запроса разбираются по колонкам сразу в массивы numpy
+    с известными типами, минуя построчное преобразование `pd.read_sql`.
+    Колонки 'cut', 'color' и 'clarity' сразу кодируются в категориальные
+    по заранее известным наборам категорий.
+
     Returns
     -------
     `pd.DataFrame`
@@ -37,22 +56,34 @@ def load_data() -> pd.DataFrame:
     Raises
     ------
     `sqlite3.OperationalError`
-        Возникает если файл базы данных не существует.
-    `pandas.errors.DatabaseError`
-        Возникает если таблицы в базе данных нет.
+        - Возникает если файл базы данных не существует.
+        - Возникает если таблицы в базе данных нет.
     """
     try:
-        with sqlite3.connect("file:diamonds.db?mode=ro", uri=True) as connection:
-            query = "SELECT carat, cut, color, clarity, price FROM diamonds"
-            df = pd.read_sql(query, connection)
-        info_logger.info("Данные успешно загружены из БД.")
-        return df
+        connection = sqlite3.connect("file:diamonds.db?mode=ro", uri=True)
     except sqlite3.OperationalError as e:
         error_logger.error(f"Не найден файл с базой данных: {e}")
         sys.exit(1)
-    except pd.errors.DatabaseError as e:
+    try:
+        query = "SELECT carat, cut, color, clarity, price FROM diamonds"
+        rows = connection.execute(query).fetchall()
+    except sqlite3.OperationalError as e:
         error_logger.error(f"Запрос к несуществующей таблице или атрибуту: {e}")
         sys.exit(1)
+    finally:
+        connection.close()
+    carat, cut, color, clarity, price = zip(*rows) if rows else ((),) * 5
+    df = pd.DataFrame(
+        {
+            "carat": np.array(carat, dtype=np.float64),
+            "cut": encode_categories(cut, CUT_DTYPE),
+            "color": encode_categories(color, COLOR_DTYPE),
+            "clarity": encode_categories(clarity, CLARITY_DTYPE),
+            "price": np.array(price, dtype=np.float64),
+        }
+    )
+    info_logger.info("Данные успешно загружены из БД.")
+    return df
 
 
 def processing_data(df: pd.DataFrame) -> tuple[pd.DataFrame, pd.Series]:
@@ -112,11 +143,10 @@ def load_model_and_metric():
         Если в файле настроек отсутствуют обязательные ключи: "file_path" или "mae_cv".
     """
     try:
-        with open(MODEL_SETTINGS_PATH, encoding="utf-8") as file:
-            model_settings = json.load(file)
-            model_path = f"{MODEL_REGISTRY_PATH}/{model_settings["file_path"]}"
-            model = joblib.load(model_path)
-            model_metric = model_settings["mae_cv"]
+        model_settings = orjson.loads(Path(MODEL_SETTINGS_PATH).read_bytes())
+        model_path = f"{MODEL_REGISTRY_PATH}/{model_settings["file_path"]}"
+        model = joblib.load(model_path)
+        model_metric = model_settings["mae_cv"]
         info_logger.info("Модель успешно загружена.")
         return model, model_metric
     except FileNotFoundError as e:
@@ -131,12 +161,53 @@ def load_model_and_metric():
         sys.exit(1)
 
 
+def get_fold_metric(
+    model,
+    X_train: pd.DataFrame,
+    y_train: pd.Series,
+    X_val: pd.DataFrame,
+    y_val: pd.Series,
+) -> float:
+    """
+    Обучает модель на одном фолде кросс-валидации и вычисляет MAE.
+
+    Модель обучается с теми же параметрами, с которыми она затем сохраняется
+    в реестр, поэтому метрика фолда соответствует сохраняемой модели.
+
+    Parameters
+    ----------
+    model : `lightgbm.sklearn.LGBMRegressor`
+        Модель машинного обучения, совместимая с scikit-learn.
+    X_train : `pd.DataFrame`
+        Матрица признаков обучающей части фолда.
+    y_train : `pd.Series`
+        Целевая переменная обучающей части фолда.
+    X_val : `pd.DataFrame`
+        Матрица признаков валидационной части фолда.
+    y_val : `pd.Series`
+        Целевая переменная валидационной части фолда.
+
+    Returns
+    -------
+    `float`
+        MAE модели на валидационной части фолда.
+    """
+    model.fit(X_train, y_train)
+    y_pred = model.predict(X_val)
+    return float(np.abs(y_val.to_numpy() - y_pred).mean())
+
+
 def get_new_metric(model, X: pd.DataFrame, y: pd.Series) -> float:
     """
     Вычисляет метрику качества модели с использованием кросс-валидации.
 
-    Функция оценивает модель с помощью кросс-валидации и возвращает
-    усредненную по фолдам MAE.
+    Функция оценивает модель с помощью кросс-валидации по `CV_N_SPLITS`
+    перемешанным фолдам и возвращает усредненную по фолдам MAE.
+
+    Фолды обучаются параллельно на половине доступных ядер, но не более чем
+    по одному процессу на фолд, а доступные ядра делятся между потоками
+    LightGBM в каждом фолде, чтобы не перегружать процессор.
+    Исходная модель при этом не изменяется.
 
     Parameters
     ----------
@@ -152,8 +223,21 @@ def get_new_metric(model, X: pd.DataFrame, y: pd.Series) -> float:
     `float`
         MAE модели, рассчитанная с помощью кросс-валидации.
     """
-    cv_scores = cross_val_score(model, X, y, cv=10, scoring="neg_mean_absolute_error")
-    new_metric = -cv_scores.mean().round(3)
+    cpu_count = os.cpu_count() or 1
+    cv_n_jobs = max(min(cpu_count // 2, CV_N_SPLITS), 1)
+    cv_model = clone(model).set_params(n_jobs=max(cpu_count // cv_n_jobs, 1))
+    kfold = KFold(n_splits=CV_N_SPLITS, shuffle=True, random_state=0)
+    fold_metrics = joblib.Parallel(n_jobs=cv_n_jobs)(
+        joblib.delayed(get_fold_metric)(
+            clone(cv_model),
+            X.iloc[train_index],
+            y.iloc[train_index],
+            X.iloc[val_index],
+            y.iloc[val_index],
+        )
+        for train_index, val_index in kfold.split(X)
+    )
+    new_metric = round(float(np.mean(fold_metrics)), 3)
     return new_metric
 
 
@@ -161,6 +245,8 @@ def dump_model(model, X: pd.DataFrame, y: pd.Series) -> str:
     """
     Обучает модель на переданных данных и сохраняет её в реестр моделей.
 
+    Модель сохраняется со сжатием zlib (`compress=3`).
+
     Parameters
     ----------
     X : `pd.DataFrame`
@@ -184,7 +270,7 @@ def dump_model(model, X: pd.DataFrame, y: pd.Series) -> str:
     current_date = date.today()
     model_name = f"diamond_{current_date}.model"
     model_path = f"{MODEL_REGISTRY_PATH}/{model_name}"
-    joblib.dump(model, model_path)
+    joblib.dump(model, model_path, compress=3)
     return model_name
 
 
@@ -192,6 +278,10 @@ def update_model_settings(model, model_name: str, model_metric: float) -> None:
     """
     Обновляет и сохраняет настройки обученной модели в JSON-файле конфигурации.
 
+    Настройки записываются во временный файл в реестре моделей, который затем
+    атомарно заменяет файл настроек, поэтому сервис никогда не прочитает
+    частично записанный файл.
+
     Parameters
     ----------
     model : `lightgbm.sklearn.LGBMRegressor`
@@ -210,10 +300,17 @@ def update_model_settings(model, model_name: str, model_metric: float) -> None:
         "file_path": model_name,
         "mae_cv": model_metric,
         "model_name": model.__class__.__name__,
-        "model_params": model.get_params(),
+        "model_params": model.get_params(deep=False),
     }
-    with open(MODEL_SETTINGS_PATH, "w", encoding="utf-8") as file:
-        json.dump(new_model_settings, file, ensure_ascii=False, indent=4)
+    tmp_settings_path = f"{MODEL_SETTINGS_PATH}.tmp"
+    with open(tmp_settings_path, "wb") as file:
+        file.write(
+            orjson.dumps(
+                new_model_settings,
+                option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY,
+            )
+        )
+    os.replace(tmp_settings_path, MODEL_SETTINGS_PATH)
 
 
 def evaluate_and_update_model(